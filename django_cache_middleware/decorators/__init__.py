@@ -1,10 +1,11 @@
 from django.conf import settings
 from django.core.cache import cache
-from django.utils.cache import patch_response_headers, add_never_cache_headers, get_max_age
+from django.utils.cache import patch_response_headers, add_never_cache_headers
 from django.utils.decorators import method_decorator
 from django.utils.functional import wraps
 
-from django_cache_middleware.decorators.utils import _combine_functions, _quotify_function
+from django_cache_middleware.decorators.utils import HashableTuple, _combine_functions, _quotify_function
+from django_cache_middleware.middleware.utils import get_max_age
 
 
 def add_cache_headers(cache_timeout=None, method=False):
@@ -28,9 +29,21 @@ def add_cache_headers(cache_timeout=None, method=False):
         viewfunc = None
 
     def decorator(viewfunc):
+
+        # Wrap the view for anonymous users once, rather than per request.
+        if hasattr(viewfunc, '_vary_on_view'):
+            anonymous_view = viewfunc
+        else:
+            anonymous_view = vary_on_authentication_status(viewfunc)
+
         @wraps(viewfunc)
         def patched_view(request, *args, **kwargs):
 
+            if request.method != 'GET' or request.is_secure():
+                # These responses never get caching headers, so don't bother
+                # checking the user.
+                return viewfunc(request, *args, **kwargs)
+
             if settings.CACHE_MIDDLEWARE_ANONYMOUS_ONLY:
                 # If the site is using the cache middleware, and it is set
                 # to only cache for anonymous users, then we will check their
@@ -43,26 +56,22 @@ def add_cache_headers(cache_timeout=None, method=False):
                 # to None to indicate that we did not even check.
                 authenticated = None
 
-            if authenticated is False and not hasattr(viewfunc, '_vary_on_view'):
+            if authenticated is False:
                 # If we did check the user's authentication status, and found
                 # that they are anonymous, then we want ensure that we are
                 # using a "vary on view" decorator. If it was not defined
                 # specifically on the view, then we can assume that we just
                 # need to cache all anonymous users exactly the same. For this,
                 # the vary_on_authentication_status can be used.
-                response = vary_on_authentication_status(viewfunc)(request, *args, **kwargs)
+                response = anonymous_view(request, *args, **kwargs)
             else:
                 # If we did not check the authentication status, or we did
                 # check and found that they are authenticated, then we can
                 # just use the view as it is.
                 response = viewfunc(request, *args, **kwargs)
 
-            if request.method != 'GET':
-                return response
             if response.status_code != 200:
                 return response
-            if request.is_secure():
-                return response
 
             if authenticated is True:
                 # We checked if the user is authenticated, and they were,
@@ -94,14 +103,15 @@ def simple_response_cache(view_func):
 
     """
 
+    # The view part of the cache key never changes, so build it once.
+    key_prefix = '%s.%s:' % (view_func.__module__, view_func.__name__)
+
     @wraps(view_func)
     def wrapped_view(request, *args, **kwargs):
 
         # Build a cache key using only the view function and the arguments;
         # nothing related to the request or current site.
-        view_path = '.'.join((view_func.__module__, view_func.__name__))
-        signature = HashableTuple((args, kwargs)).hash
-        cache_key = ':'.join((view_path, signature))
+        cache_key = key_prefix + HashableTuple.fast_hash(args, kwargs)
 
         # Retrieve the response from the cache, or generate a new one.
         if getattr(request, '_purging', False):
@@ -164,7 +174,9 @@ def vary_on_view(value_func):
 
     The argument "value_func" must be a view-like function that accepts the
     same arguments as the view that is being decorated. It must return a value
-    to be used in the response's cache key.
+    to be used in the response's cache key. It is called by the cache
+    middleware before the view runs, and again afterwards for the response
+    header, so the header reflects any change the view makes to the user.
 
     This decorator adds a custom response header, which the cache middleware
     will use when generating the response's cache key.
@@ -1,28 +1,66 @@
-import inspect
 import hashlib
+import types
+
+from itertools import chain
 
 from django.utils.encoding import force_unicode
 
 from urllib import quote
 
 
+# The number of quoted values that each vary function will remember. Functions
+# such as vary_on_user_id can return any number of values, so this is limited.
+_QUOTED_CACHE_SIZE = 64
+
+# View argument types that HashableTuple.fast_hash can hash directly.
+_SIMPLE_TYPES = frozenset([str, unicode, int, type(None)])
+
+
+def _create_from_sequence(cls, item):
+    return tuple(cls._create_sequence(*item))
+
+
+def _create_from_dict(cls, item):
+    return tuple([(key, cls._create_one(item[key])) for key in sorted(item)])
+
+
+def _create_from_text(cls, item):
+    return force_unicode(item)
+
+
 class HashableTuple(tuple):
 
+    # Handlers for the most common argument types, looked up by exact type.
+    # Anything else, including subclasses of these, goes through the slower
+    # isinstance checks in _create_one.
+    _handlers = {
+        list: _create_from_sequence,
+        tuple: _create_from_sequence,
+        set: _create_from_sequence,
+        dict: _create_from_dict,
+        int: _create_from_text,
+        str: _create_from_text,
+        unicode: _create_from_text,
+    }
+
     def __new__(cls, *items):
         return tuple.__new__(cls, cls._create_sequence(items))
 
     @classmethod
     def _create_one(cls, item):
+        handler = cls._handlers.get(type(item))
+        if handler is not None:
+            return handler(cls, item)
         if isinstance(item, cls):
             return item
         elif isinstance(item, (list, tuple, set)):
-            return tuple(cls._create_sequence(*item))
+            return _create_from_sequence(cls, item)
         if isinstance(item, dict):
-            return tuple((key, cls._create_one(value)) for (key, value) in sorted(item.items()))
-        elif inspect.isclass(item) or inspect.isfunction(item) or inspect.ismethod(item):
+            return _create_from_dict(cls, item)
+        elif isinstance(item, (type, types.ClassType, types.FunctionType, types.MethodType)):
             return item.__name__
         elif isinstance(item, (int, basestring)):
-            return force_unicode(item)
+            return _create_from_text(cls, item)
         else:
             return item
 
@@ -33,20 +71,78 @@ class HashableTuple(tuple):
 
     @property
     def hash(self):
-        return hashlib.sha256(repr(self)).hexdigest()
+        """
+        Hashes the items without building a repr of the whole tuple. Nested
+        tuples are walked with an explicit stack and fed into the digest one
+        item at a time.
+
+        """
+        md5 = hashlib.md5('(')
+        update = md5.update
+        stack = [iter(self)]
+        push = stack.append
+        while stack:
+            for item in stack[-1]:
+                if isinstance(item, tuple):
+                    update('(')
+                    push(iter(item))
+                    break
+                update(repr(item) + ',')
+            else:
+                stack.pop()
+                update(')')
+        return md5.hexdigest()
+
+    @classmethod
+    def fast_hash(cls, args, kwargs):
+        """
+        Returns a hash of the given view arguments. Views are usually only
+        given strings and numbers from the URL, which are hashed directly
+        instead of building a HashableTuple first. Either way, the result is
+        the same as cls((args, kwargs)).hash.
+
+        """
+        for value in chain(args, kwargs.itervalues()):
+            if type(value) not in _SIMPLE_TYPES:
+                return cls((args, kwargs)).hash
+        # Normalise the values like _create_one does, and build the same text
+        # that the hash property would feed into the digest.
+        args_text = ''.join([
+            repr(value if value is None else force_unicode(value)) + ','
+            for value in args
+        ])
+        kwargs_text = ''.join([
+            '(%r,%r,)' % (key, value if value is None else force_unicode(value))
+            for key, value in sorted(kwargs.iteritems())
+        ])
+        return hashlib.md5('((((%s)(%s))))' % (args_text, kwargs_text)).hexdigest()
 
 
 def _quotify_function(func):
+
+    # Most vary functions return one of a handful of values, so remember how
+    # each one is quoted. The type is part of the key because True == 1.
+    quoted = {}
+
+    def quotify(func_result):
+        key = (type(func_result), func_result)
+        try:
+            return quoted[key]
+        except KeyError:
+            value = quoted[key] = '%s;' % quote(str(func_result))
+            if len(quoted) > _QUOTED_CACHE_SIZE:
+                quoted.clear()
+            return value
+        except TypeError:
+            # Unhashable results cannot be remembered.
+            return '%s;' % quote(str(func_result))
+
     def inner(*args, **kwargs):
-        func_result = func(*args, **kwargs)
-        return '%s;' % quote(str(func_result))
+        return quotify(func(*args, **kwargs))
     return inner
 
 
 def _combine_functions(*funcs):
     def inner(*args, **kwargs):
-        result = ''
-        for func in funcs:
-            result += func(*args, **kwargs)
-        return result
+        return ''.join([func(*args, **kwargs) for func in funcs])
     return inner
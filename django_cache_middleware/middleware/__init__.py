@@ -2,13 +2,14 @@ from django.core.cache import cache as cache_backend
 from django.core.exceptions import ImproperlyConfigured
 from django.http import HttpResponseNotModified, HttpResponseForbidden
 from django.middleware import cache as original
-from django.utils.cache import get_max_age, patch_response_headers
+from django.utils.cache import patch_response_headers
 
 from django_cache_middleware.middleware.utils import (
     generate_cache_key,
-    get_cached_headers,
+    get_cached_headers_and_response,
+    get_max_age,
     has_vary_header,
-    learn_cache_key,
+    learn_cache_keys,
     not_modified,
 )
 
@@ -25,6 +26,7 @@ class UpdateCacheMiddleware(original.UpdateCacheMiddleware):
     * Caches the full URL including host and querystring.
     * Caches extra data to support returning "304 Not Modified" responses.
     * Caches extra data to support the "Vary-On-View" header.
+    * Stores the headers list and the response with a single set_many call.
 
     """
 
@@ -50,7 +52,7 @@ class UpdateCacheMiddleware(original.UpdateCacheMiddleware):
         if getattr(request, 'response_has_esi', False):
             response['Has-ESI'] = True
 
-        if response.has_header('ETag') and not response['ETag']:
+        if response.get('ETag', None) == '':
             del response['ETag']
 
         if not self._should_update_cache(request, response):
@@ -77,8 +79,9 @@ class UpdateCacheMiddleware(original.UpdateCacheMiddleware):
         patch_response_headers(response, timeout)
 
         if timeout:
-            cache_key = learn_cache_key(request, response, timeout, self.key_prefix)
-            cache_backend.set(cache_key, response, timeout)
+            # Store the headers list and the response in one trip to the cache.
+            headers_key, key_headers, cache_key = learn_cache_keys(request, response, self.key_prefix)
+            cache_backend.set_many({headers_key: key_headers, cache_key: response}, timeout)
 
         return response
 
@@ -104,14 +107,18 @@ class FetchFromCacheMiddleware(original.FetchFromCacheMiddleware):
             return
 
         response = cache_backend.get(cache_key, None)
+        return self._process_cached_response(request, response)
+
+    def _process_cached_response(self, request, response):
+
         if response is None:
             # No cache information available, need to rebuild.
             request._cache_update_cache = True
             return None
 
         # Check the Etag/Last-Modified headers of the cache response.
-        etag = response.has_header('Etag') and response['Etag']
-        last_modified = response.has_header('Last-Modified') and response['Last-Modified']
+        etag = response.get('Etag', None)
+        last_modified = response.get('Last-Modified', None)
         if not_modified(request, etag, last_modified):
             # Nothing changed since they last downloaded it.
             request._cache_update_cache = False
@@ -139,7 +146,9 @@ class FetchFromCacheMiddleware(original.FetchFromCacheMiddleware):
             request._cache_update_cache = False
             return
 
-        headers = get_cached_headers(request, self.key_prefix)
+        # The response is fetched along with the headers, in case they show
+        # that it doesn't vary. This saves a second trip to the cache.
+        headers, response = get_cached_headers_and_response(request, self.key_prefix)
         if headers is None:
             # No cache information available, need to rebuild.
             request._cache_update_cache = True
@@ -160,6 +169,11 @@ class FetchFromCacheMiddleware(original.FetchFromCacheMiddleware):
             request._cache_update_cache = False
             return HttpResponseNotModified()
 
+        if not headers:
+            # Nothing varies, so the response that was fetched along with the
+            # headers is the right one.
+            return self._process_cached_response(request, response)
+
         # Try to return a cached response, using the request + cached headers.
         return self._process_headers(request, headers)
 
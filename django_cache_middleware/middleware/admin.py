@@ -1,4 +1,6 @@
-from django.utils.cache import add_never_cache_headers, get_max_age
+from django.utils.cache import add_never_cache_headers
+
+from django_cache_middleware.middleware.utils import get_max_age
 
 
 class AdminCacheBypassMiddleware(object):
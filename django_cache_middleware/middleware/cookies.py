@@ -4,15 +4,41 @@ from django.conf import settings
 from django.core.exceptions import MiddlewareNotUsed
 
 
+# Compiled patterns, keyed by the tuple of cookie names they match.
+_compiled_patterns = {}
+
+
 def get_cookie_patterns(cookie_names):
     for name in cookie_names:
-        yield r'%s=.+?(?:; |$)\w*' % name
+        yield name
 
 
 def compile_cookie_patterns(cookie_names):
-    patterns = get_cookie_patterns(cookie_names)
-    patterns = ('(%s)' % pattern for pattern in patterns)
-    return re.compile('|'.join(patterns))
+    """
+    Builds a single pattern that matches any of the named cookies, along with
+    the separator that follows it. The cookie itself is captured in group 1.
+
+    The names are regular expressions, so a name such as "__utm." matches all
+    of the Google Analytics cookies.
+
+    Cookie values cannot contain semicolons, so the value is matched with a
+    negated character class rather than a lazy wildcard. This keeps the scan
+    linear in the length of the Cookie header, no matter how many names are
+    being matched, as long as the names themselves do not match semicolons.
+
+    The pattern is compiled from a byte string, as cookie names are ASCII and
+    the Cookie header in request.META is a byte string too. Each set of names
+    is only compiled once, however many middleware instances use it.
+
+    """
+    cookie_names = tuple(cookie_names)
+    try:
+        return _compiled_patterns[cookie_names]
+    except KeyError:
+        names = '|'.join(get_cookie_patterns(cookie_names))
+        pattern = r'(?<![^;\s])((?:%s)=[^;]*)(?:;\s*|$)' % names
+        compiled = _compiled_patterns[cookie_names] = re.compile(pattern.encode('ascii'))
+        return compiled
 
 
 class StripCookiesMiddleware(object):
@@ -34,20 +60,21 @@ class StripCookiesMiddleware(object):
         allowed_cookies = getattr(settings, 'ALLOWED_COOKIE_NAMES', None)
         if allowed_cookies:
             self.allowed_cookies = compile_cookie_patterns(allowed_cookies)
+            self.clean_cookies = self._keep_allowed_cookies
         else:
             strip_cookies = getattr(settings, 'STRIP_COOKIE_NAMES', None)
             if strip_cookies:
                 self.strip_cookies = compile_cookie_patterns(strip_cookies)
+                self.clean_cookies = self._remove_strip_cookies
             else:
                 raise MiddlewareNotUsed()
 
+    def _keep_allowed_cookies(self, cookie):
+        return '; '.join(self.allowed_cookies.findall(cookie))
+
+    def _remove_strip_cookies(self, cookie):
+        return self.strip_cookies.sub('', cookie).rstrip('; ')
+
     def process_request(self, request):
         if 'HTTP_COOKIE' in request.META:
-            if hasattr(self, 'allowed_cookies'):
-                cookies = []
-                for match in self.allowed_cookies.finditer(request.META['HTTP_COOKIE']):
-                    cookies.append(match.group(0))
-                cleaned_cookies = ';'.join(cookies)
-            else:
-                cleaned_cookies = self.strip_cookies.sub('', request.META['HTTP_COOKIE'])
-            request.META['HTTP_COOKIE'] = cleaned_cookies
+            request.META['HTTP_COOKIE'] = self.clean_cookies(request.META['HTTP_COOKIE'])
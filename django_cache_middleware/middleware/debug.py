@@ -2,16 +2,40 @@ import sys
 
 from django.conf import settings
 from django.core.exceptions import MiddlewareNotUsed
-from django.utils.cache import get_max_age
 from django.views.debug import technical_500_response
 
-from django_cache_middleware.middleware.utils import has_vary_header
+from django_cache_middleware.middleware.utils import get_max_age, has_vary_header
 
 
 class InvalidHeadersWarning(Exception):
     pass
 
 
+class MissingHeadersWarning(InvalidHeadersWarning):
+    """
+    Raised when a response is missing the required caching headers. The
+    current headers are only formatted into the message when it is shown, so
+    use str() to get the message. The args are filled in at that point.
+
+    """
+
+    message_format = (
+        "This URL does not have the required caching headers. "
+        "Typical GET requests must return a response with caching headers defined at the view level. "
+        "The current headers are: %s"
+    )
+
+    def __init__(self, response):
+        InvalidHeadersWarning.__init__(self)
+        self.response = response
+
+    def __str__(self):
+        if not self.args:
+            headers = ', '.join([': '.join(header) for header in self.response._headers.values()])
+            self.args = (self.message_format % headers,)
+        return self.args[0]
+
+
 def handle_uncaught_exception(process_response):
     def safe_process_response(self, request, response):
         try:
@@ -42,11 +66,14 @@ class StrictHeadersMiddleware(object):
     def __init__(self):
         if not settings.DEBUG:
             raise MiddlewareNotUsed
+        # startswith() accepts a tuple, so all paths are checked in one call.
+        self.ignored_paths = tuple(self.ignored_paths)
 
     @staticmethod
-    def _assert_cache_anonymous_only(request, response):
+    def _check_cache_anonymous_only(request, response):
         """
-        Assert that we only do caching for anonymous users.
+        Check that we only do caching for anonymous users, returning a
+        description of the problem if not.
         This is pretty tricky and not everything is being checked.
         This is only used by Finda Social which is defunct; so nobody cares.
 
@@ -63,16 +90,20 @@ class StrictHeadersMiddleware(object):
 
             # It is tricky to check that a response hasn't been added to the
             # cache, but we can check that it hasn't been fetched from there.
-            assert 'X-From-Cache' not in response, 'You are logged in but it somehow served you a cached page.'
+            if 'X-From-Cache' in response:
+                return 'You are logged in but it somehow served you a cached page.'
 
             # Ensure that the vary header is there. If not, then the middleware
             # is in the wrong order and things will be crazy.
-            assert has_vary_header(response, 'Cookie'), 'The "Vary: Cookie" header was not set, even though your cookie was accessed.'
+            if not has_vary_header(response, 'Cookie'):
+                return 'The "Vary: Cookie" header was not set, even though your cookie was accessed.'
+
+        return None
 
     @staticmethod
-    def _assert_has_headers(response):
+    def _has_headers(response):
         """
-        Assert that we have the standard caching headers.
+        Check that we have the standard caching headers.
 
         Good decorators to use:
             from django_cache_middleware.decorators import add_cache_headers
@@ -83,16 +114,20 @@ class StrictHeadersMiddleware(object):
         # A max-age value must be set.
         # A value of 0 is acceptable.
         max_age_header = get_max_age(response)
-        assert max_age_header is not None
+        if max_age_header is None:
+            return False
 
         # And check for the other ones too.
         for header in ('ETag', 'Last-Modified', 'Expires'):
-            assert header in response
+            if header not in response:
+                return False
+
+        return True
 
     @staticmethod
-    def _assert_not_cached(response):
+    def _is_not_cached(response):
         """
-        Assert that the the max-age header is defined and set to 0,
+        Check that the the max-age header is defined and set to 0,
         or that has a custom vary-on-view header.
 
         Good decorator to use:
@@ -101,7 +136,7 @@ class StrictHeadersMiddleware(object):
         """
 
         max_age_header = get_max_age(response)
-        assert (max_age_header == 0) or ('X-Vary-On-View' in response)
+        return (max_age_header == 0) or ('X-Vary-On-View' in response)
 
     @classmethod
     def _typical_get_request(cls, request, response):
@@ -116,9 +151,8 @@ class StrictHeadersMiddleware(object):
     def process_response(self, request, response):
 
         # Some built in django views have no caching headers. Ignore them.
-        for path in self.ignored_paths:
-            if request.path.startswith(path):
-                return response
+        if request.path.startswith(self.ignored_paths):
+            return response
 
         if response.status_code == 304:
             # Not Modified responses don't need to be checked. They will
@@ -143,17 +177,8 @@ class StrictHeadersMiddleware(object):
             return response
 
         # All typical GET requests must have some caching headers defined.
-        try:
-            self._assert_has_headers(response)
-        except AssertionError:
-            message = (
-                "This URL does not have the required caching headers. "
-                "Typical GET requests must return a response with caching headers defined at the view level. "
-                "The current headers are: %s"
-            )
-            header_list = [': '.join(header) for header in response._headers.values()]
-            headers = ', '.join(header_list)
-            raise InvalidHeadersWarning(message % headers)
+        if not self._has_headers(response):
+            raise MissingHeadersWarning(response)
 
         session_was_accessed = hasattr(request, 'session') and request.session.accessed
 
@@ -163,25 +188,20 @@ class StrictHeadersMiddleware(object):
                 # When using this setting, all of the requirements for headers
                 # have changed. This is just for Finda Social, which has very
                 # different caching rules than the other sites.
-                try:
-                    self._assert_cache_anonymous_only(request, response)
-                except AssertionError, error:
+                error = self._check_cache_anonymous_only(request, response)
+                if error:
                     raise InvalidHeadersWarning('CACHE_MIDDLEWARE_ANONYMOUS_ONLY is enabled and the following occurred: %s' % error)
-                else:
-                    return response
-
-            if session_was_accessed:
-                message_info = "accessed the user's session (probably by simply accessing request.user)"
-            else:
-                message_info = "returned a response with the Vary: Cookie header"
-            message = "This URL has %s, but the response still has standard caching headers. You can't do both!" % message_info
+                return response
 
             # If the session has been accessed and/or the "Vary: Cookie" header
             # exists, then the HTTP headers should specify that the response
             # is not to be cached.
-            try:
-                self._assert_not_cached(response)
-            except AssertionError:
+            if not self._is_not_cached(response):
+                if session_was_accessed:
+                    message_info = "accessed the user's session (probably by simply accessing request.user)"
+                else:
+                    message_info = "returned a response with the Vary: Cookie header"
+                message = "This URL has %s, but the response still has standard caching headers. You can't do both!" % message_info
                 raise InvalidHeadersWarning(message)
 
         return response
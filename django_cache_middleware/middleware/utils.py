@@ -1,12 +1,124 @@
+import calendar
 import datetime
+import re
+import string
 
 from django.conf import settings
 from django.core.cache import cache
-from django.utils.cache import cc_delim_re, _i18n_cache_key_suffix
+from django.utils.cache import cc_delim_re
+from django.utils.cache import get_max_age as _parse_max_age
 from django.utils.encoding import iri_to_uri
-from django.utils.hashcompat import md5_constructor
+from django.utils.translation import get_language
 
 from email.Utils import parsedate
+from hashlib import md5
+
+
+# Converts a header name from a Vary header into its request.META format,
+# e.g. Accept-Encoding to ACCEPT_ENCODING, in a single pass.
+_meta_name_table = string.maketrans(string.ascii_lowercase + '-', string.ascii_uppercase + '_')
+
+# The request.META names of headers that responses commonly vary on, so they
+# can be looked up rather than converted.
+_vary_meta_names = {
+    'Accept-Encoding': 'HTTP_ACCEPT_ENCODING',
+    'Accept-Language': 'HTTP_ACCEPT_LANGUAGE',
+    'Cookie': 'HTTP_COOKIE',
+    'User-Agent': 'HTTP_USER_AGENT',
+}
+
+# Paths made up only of characters that iri_to_uri leaves alone, which is
+# nearly all of them, don't need to go through it.
+_uri_safe_re = re.compile(r"[\w.\-/#%\[\]=:;$&()+,!?*@'~]*\Z")
+
+# Headers that responses commonly vary on, in sorted order. When a response
+# only varies on these, walking this is cheaper than sorting its headers.
+_common_key_headers = (
+    'HTTP_ACCEPT_ENCODING',
+    'HTTP_ACCEPT_LANGUAGE',
+    'HTTP_COOKIE',
+    'HTTP_USER_AGENT',
+    'X-Vary-On-View',
+)
+
+# The digest of no header values, used for responses that don't vary.
+_empty_digest = md5('').hexdigest()
+
+# The fixed start of the header and response cache keys for each key prefix.
+_key_starts = {}
+
+
+def _get_key_starts(key_prefix):
+    """
+    Returns the start of the header and response cache keys for a key
+    prefix. These are built once per prefix and then joined to the digests
+    with plain concatenation.
+
+    """
+    try:
+        return _key_starts[key_prefix]
+    except KeyError:
+        starts = _key_starts[key_prefix] = (
+            'cache_middleware.headers.%s.' % key_prefix,
+            'cache_middleware.response.%s.' % key_prefix,
+        )
+        return starts
+
+
+def get_max_age(response):
+    """
+    Returns the max-age from the response Cache-Control header as an integer
+    (or None if it wasn't found or wasn't an integer).
+
+    The parsed value is remembered on the response, so several middleware
+    can check it without parsing the header each time. It is parsed again if
+    the Cache-Control header has changed since.
+
+    """
+    cache_control = response.get('Cache-Control', None)
+    cached = getattr(response, '_cache_max_age', None)
+    if cached is not None and cached[0] == cache_control:
+        return cached[1]
+    max_age = _parse_max_age(response)
+    response._cache_max_age = (cache_control, max_age)
+    return max_age
+
+
+def _i18n_cache_key_suffix(request, cache_key):
+    """
+    If enabled, returns the cache key ending with a locale.
+    NOTE: This was copied from Django, with the following changes:
+    * Only looks up the active language when the request has no
+      LANGUAGE_CODE, rather than every time.
+
+    """
+    if settings.USE_I18N:
+        language = getattr(request, 'LANGUAGE_CODE', None)
+        if language is None:
+            language = get_language()
+        cache_key += '.' + language
+    return cache_key
+
+
+def _generate_url_digest(request):
+    """
+    Returns a hex digest of the request's host and full path, hashed in a
+    single call rather than updating the digest with each part. Each request
+    needs this for several cache keys, so it is remembered on the request.
+
+    """
+    digest = getattr(request, '_cache_middleware_url_digest', None)
+    if digest is None:
+        path = request.get_full_path()
+        if _uri_safe_re.match(path):
+            # The path is all ASCII, so encode it to join it to the host as a
+            # byte string, as iri_to_uri would have done.
+            path = path.encode('ascii')
+        else:
+            path = iri_to_uri(path)
+        url = request.get_host() + path
+        digest = request._cache_middleware_url_digest = md5(url).hexdigest()
+    return digest
 
 
 def _generate_cache_header_key(key_prefix, request):
@@ -15,10 +127,7 @@ def _generate_cache_header_key(key_prefix, request):
     NOTE: This includes the querystring in the URL.
 
     """
-    url = md5_constructor()
-    url.update(request.get_host())
-    url.update(iri_to_uri(request.get_full_path()))
-    cache_key = 'cache_middleware.headers.%s.%s' % (key_prefix, url.hexdigest())
+    cache_key = _get_key_starts(key_prefix)[0] + _generate_url_digest(request)
     return _i18n_cache_key_suffix(request, cache_key)
 
 
@@ -35,18 +144,23 @@ def generate_cache_key(request, headers, key_prefix=None):
     """
     if key_prefix is None:
         key_prefix = settings.CACHE_MIDDLEWARE_KEY_PREFIX
-    ctx = md5_constructor()
-    for header, value in sorted(headers.items()):
-        if value is None:
-            value = request.META.get(header, None)
+    meta = request.META
+    values = []
+    if headers:
+        names = [name for name in _common_key_headers if name in headers]
+        if len(names) != len(headers):
+            names = sorted(headers)
+        for header in names:
+            value = headers[header]
+            if value is None:
+                value = meta.get(header, None)
             if value is not None:
-                ctx.update(value)
-        else:
-            ctx.update(value)
-    url = md5_constructor()
-    url.update(request.get_host())
-    url.update(iri_to_uri(request.get_full_path()))
-    cache_key = 'cache_middleware.response.%s.%s.%s' % (key_prefix, url.hexdigest(), ctx.hexdigest())
+                values.append(value)
+    if values:
+        values_digest = md5(''.join(values)).hexdigest()
+    else:
+        values_digest = _empty_digest
+    cache_key = _get_key_starts(key_prefix)[1] + _generate_url_digest(request) + '.' + values_digest
     return _i18n_cache_key_suffix(request, cache_key)
 
 
@@ -58,6 +172,25 @@ def get_cached_headers(request, key_prefix=None):
     return cache.get(cache_key, None)
 
 
+def get_cached_headers_and_response(request, key_prefix=None):
+    """
+    Returns the cached headers list for a given request's path, and the
+    cached response for that path if the response does not vary on any
+    headers. Both are fetched from the cache in a single round-trip.
+
+    The response key is a guess, as it is not known if the response varies
+    until the headers have been fetched. If the headers show that it does
+    vary, the response returned here should be ignored.
+
+    """
+    if key_prefix is None:
+        key_prefix = settings.CACHE_MIDDLEWARE_KEY_PREFIX
+    headers_key = _generate_cache_header_key(key_prefix, request)
+    response_key = generate_cache_key(request, {}, key_prefix)
+    cached = cache.get_many([headers_key, response_key])
+    return cached.get(headers_key), cached.get(response_key)
+
+
 def learn_cache_key(request, response, cache_timeout=None, key_prefix=None):
     """
     NOTE: This was copied from Django, with the following changes:
@@ -81,24 +214,49 @@ def learn_cache_key(request, response, cache_timeout=None, key_prefix=None):
 
     """
 
-    if key_prefix is None:
-        key_prefix = settings.CACHE_MIDDLEWARE_KEY_PREFIX
-
     if cache_timeout is None:
         cache_timeout = settings.CACHE_MIDDLEWARE_SECONDS
 
+    headers_key, key_headers, cache_key = learn_cache_keys(request, response, key_prefix)
+
+    # Cache this list of headers against this request URL.
+    # This is the "global path registry" that everyone is talking about.
+    cache.set(headers_key, key_headers, cache_timeout)
+
+    return cache_key
+
+
+def learn_cache_keys(request, response, key_prefix=None):
+    """
+    Works like learn_cache_key, but returns the header cache key and the
+    headers list instead of storing them. Returns a tuple of:
+        (header cache key, headers list, response cache key)
+
+    This allows the caller to store the headers list and the response in a
+    single call to the cache.
+
+    """
+
+    if key_prefix is None:
+        key_prefix = settings.CACHE_MIDDLEWARE_KEY_PREFIX
+
     # Get the Vary headers, to build a cache key for this response. For
     # example, a response that varies on cookie would result in multiple
     # cached responses; one for each cookie value that is encountered. This
     # dictionary is effectively a list, as it does not have any values.
     response_headers = {}
-    if response.has_header('Vary'):
-        for header in cc_delim_re.split(response['Vary']):
-            response_headers['HTTP_' + header.upper().replace('-', '_')] = None
-
-    if response.has_header('X-Vary-On-View'):
+    vary = response.get('Vary', None)
+    if vary is not None:
+        for header in cc_delim_re.split(vary):
+            meta_name = _vary_meta_names.get(header)
+            if meta_name is None:
+                meta_name = 'HTTP_' + header.translate(_meta_name_table)
+            response_headers[meta_name] = None
+
+    vary_on_view = response.get('X-Vary-On-View', None)
+    if vary_on_view is not None:
         # When available, use the Vary-On-View header instead of the Cookie.
-        response_headers['X-Vary-On-View'] = response['X-Vary-On-View']
+        response_headers['X-Vary-On-View'] = vary_on_view
         if 'HTTP_COOKIE' in response_headers:
             del response_headers['HTTP_COOKIE']
         key_headers = response_headers
@@ -108,20 +266,22 @@ def learn_cache_key(request, response, cache_timeout=None, key_prefix=None):
         # the values are not for a different version of the page. This avoids
         # fetching the response for no reason.
         key_headers = {}
-        if response.has_header('Etag'):
-            key_headers['HTTP_ETAG'] = response['Etag']
-        if response.has_header('Last-Modified'):
-            key_headers['HTTP_LAST_MODIFIED'] = response['Last-Modified']
+        etag = response.get('Etag', None)
+        if etag is not None:
+            key_headers['HTTP_ETAG'] = etag
+        last_modified = response.get('Last-Modified', None)
+        if last_modified is not None:
+            key_headers['HTTP_LAST_MODIFIED'] = last_modified
         key_headers.update(response_headers)
 
-    # Cache this list of headers against this request URL.
-    # This is the "global path registry" that everyone is talking about.
-    cache_key = _generate_cache_header_key(key_prefix, request)
-    cache.set(cache_key, key_headers, cache_timeout)
+    # The list of headers is cached against this request URL.
+    headers_key = _generate_cache_header_key(key_prefix, request)
 
     # Generate a cache key for this response. This will be based on the
     # request path and the request HTTP header values (the vary ones).
-    return generate_cache_key(request, response_headers, key_prefix)
+    cache_key = generate_cache_key(request, response_headers, key_prefix)
+
+    return headers_key, key_headers, cache_key
 
 
 def parse_http_date(date_string):
@@ -130,12 +290,41 @@ def parse_http_date(date_string):
     Doesn't support every single format, but it's good enough.
 
     """
+    parsed = parsedate(date_string)
+    if parsed is None:
+        return None
     try:
-        return datetime.datetime(*parsedate(date_string)[:6])
-    except:
+        return datetime.datetime(*parsed[:6])
+    except (ValueError, OverflowError):
+        # The string parsed, but it had values out of range such as a 32nd
+        # day of the month, or a year too large for a C long.
         return None
 
 
+def parse_http_timestamp(date_string):
+    """
+    Converts a HTTP datetime string into a POSIX timestamp. This is cheaper
+    than parse_http_date when the dates only need to be compared.
+
+    """
+    parsed = parsedate(date_string)
+    if parsed is None:
+        return None
+    try:
+        return calendar.timegm(parsed)
+    except (ValueError, OverflowError):
+        # The string parsed, but it had values out of range such as a year
+        # after 9999 or a 13th month.
+        return None
+
+
+def _unquote_etag(etag):
+    """Removes the surrounding quotes from an ETag, if it has them."""
+    if etag.startswith('"') and etag.endswith('"'):
+        return etag[1:-1]
+    return etag
+
+
 def not_modified(request, etag=None, last_modified=None):
     """
     Compares the request against the Etag/Last-Modified headers, to determine
@@ -146,10 +335,11 @@ def not_modified(request, etag=None, last_modified=None):
     if 'HTTP_IF_NONE_MATCH' in request.META:
         if etag:
             client = request.META['HTTP_IF_NONE_MATCH']
-            server = etag
-            if client.strip('"') == server.strip('"'):
+            # Clients usually send back the exact ETag they were given, so
+            # compare as-is before unquoting them.
+            if client == etag:
                 return True
-            return False
+            return _unquote_etag(client) == _unquote_etag(etag)
 
     if 'HTTP_IF_MODIFIED_SINCE' in request.META:
         if last_modified:
@@ -157,7 +347,16 @@ def not_modified(request, etag=None, last_modified=None):
             server = last_modified
             if client == server:
                 return True
-            if parse_http_date(server) <= parse_http_date(client):
+            # This can be called more than once per request, e.g. for the
+            # cached headers and then for the cached response, so only parse
+            # the client's date once.
+            if not hasattr(request, '_cache_middleware_if_modified_since'):
+                request._cache_middleware_if_modified_since = parse_http_timestamp(client)
+            client_date = request._cache_middleware_if_modified_since
+            if client_date is None:
+                return False
+            server_date = parse_http_timestamp(server)
+            if server_date is not None and server_date <= client_date:
                 return True
         return False
 
@@ -168,9 +367,18 @@ def has_vary_header(response, header_query):
     """
     Checks to see if the response has a given header name in its Vary header.
     Copied from Django 1.2.5 so we can use it in Django 1.2.4
+
+    The parsed Vary header is remembered on the response, and is only parsed
+    again if the header has changed since.
+
     """
-    if not response.has_header('Vary'):
+    vary = response.get('Vary', None)
+    if vary is None:
         return False
-    vary_headers = cc_delim_re.split(response['Vary'])
-    existing_headers = set([header.lower() for header in vary_headers])
+    cached = getattr(response, '_cache_vary_headers', None)
+    if cached is not None and cached[0] == vary:
+        existing_headers = cached[1]
+    else:
+        existing_headers = set([header.strip().lower() for header in vary.split(',')])
+        response._cache_vary_headers = (vary, existing_headers)
     return header_query.lower() in existing_headers
@@ -3,9 +3,11 @@ import time
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.http import HttpRequest
 from django.test import TestCase
 
-from django_cache_middleware.utils import parse_http_date
+from django_cache_middleware.middleware.cookies import StripCookiesMiddleware
+from django_cache_middleware.middleware.utils import parse_http_date, parse_http_timestamp
 
 
 class CacheMiddlewareTests(TestCase):
@@ -97,6 +99,24 @@ class CacheMiddlewareTests(TestCase):
             self.assertTrue(response.has_header('X-From-Cache'))
             self.assertContains(response, 'test_authentication_status: testuser1')
 
+    def test_view_changes_user(self):
+        """
+        The X-Vary-On-View header must use the value from after the view has
+        run. Otherwise a view that logs the user out would be cached under the
+        key for authenticated users.
+
+        """
+
+        User.objects.create_user(username='testuser1', email='', password='test')
+        self.assertTrue(self.client.login(username='testuser1', password='test'))
+
+        # Use the current time to make a URL that won't have been cached before.
+        url = '/test_logout/?time=%s' % time.time()
+
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('X-From-Cache'))
+        self.assertEqual(response['X-Vary-On-View'], 'False;')
+
     def test_undecorated(self):
 
         # Use the current time to make a URL that won't have been cached before.
@@ -139,6 +159,41 @@ class CacheMiddlewareTests(TestCase):
         self.assertTrue(response.has_header('X-From-Cache'))
         self.assertFalse(response.has_header('X-Vary-On-View'))
 
+    def test_non_ascii_host(self):
+        """
+        Django does not validate the Host header, so the cache keys must
+        cope with any bytes in it.
+
+        """
+
+        # Use the current time to make a URL that won't have been cached before.
+        url = '/test_undecorated/?time=%s' % time.time()
+
+        response = self.client.get(url, HTTP_HOST='ex\xe4mple.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-From-Cache'))
+
+        response = self.client.get(url, HTTP_HOST='ex\xe4mple.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('X-From-Cache'))
+
+    def test_context_processors(self):
+        """
+        If the context processors access the session, then every view that
+        renders a template will vary on cookies and be cached per user.
+
+        """
+
+        # Use the current time to make a URL that won't have been cached before.
+        url = '/test_context_processors/?time=%s' % time.time()
+
+        # The view builds a RequestContext. The session middleware adds a
+        # Vary header if the session was accessed.
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-From-Cache'))
+        self.assertFalse(response.has_header('Vary'))
+
     def test_cache_page_decorator(self):
         """
         Django's decorator normally uses Django's middleware. It has been
@@ -181,3 +236,60 @@ class CacheMiddlewareTests(TestCase):
 
         from django.views.decorators.cache import CacheMiddleware
         self.assertEqual(CacheMiddleware.__module__, 'django_cache_middleware.middleware')
+
+
+class StripCookiesTests(TestCase):
+
+    cookie = '__utma=1.2.3; sessionid=abc; __utmz=1.utmcsr=(direct)|utmcmd=(none)'
+
+    def setUp(self):
+        self.allowed_cookie_names = getattr(settings, 'ALLOWED_COOKIE_NAMES', None)
+        self.strip_cookie_names = getattr(settings, 'STRIP_COOKIE_NAMES', None)
+
+    def tearDown(self):
+        settings.ALLOWED_COOKIE_NAMES = self.allowed_cookie_names
+        settings.STRIP_COOKIE_NAMES = self.strip_cookie_names
+
+    def clean_cookie(self, cookie, allowed=None, strip=None):
+        settings.ALLOWED_COOKIE_NAMES = allowed
+        settings.STRIP_COOKIE_NAMES = strip
+        request = HttpRequest()
+        request.META['HTTP_COOKIE'] = cookie
+        StripCookiesMiddleware().process_request(request)
+        return request.META['HTTP_COOKIE']
+
+    def test_strip_cookies(self):
+        cookie = self.clean_cookie(self.cookie, strip=['__utma', '__utmz'])
+        self.assertEqual(cookie, 'sessionid=abc')
+
+    def test_strip_cookie_patterns(self):
+        # The names are regular expressions.
+        cookie = self.clean_cookie(self.cookie, strip=['__utm.'])
+        self.assertEqual(cookie, 'sessionid=abc')
+
+    def test_allowed_cookies(self):
+        cookie = self.clean_cookie(self.cookie, allowed=['sessionid', '__utmz'])
+        self.assertEqual(cookie, 'sessionid=abc; __utmz=1.utmcsr=(direct)|utmcmd=(none)')
+
+    def test_similar_names(self):
+        # Only whole cookie names should match.
+        cookie = self.clean_cookie('sessionid=abc; id=1', strip=['id'])
+        self.assertEqual(cookie, 'sessionid=abc')
+
+
+class ParseHttpDateTests(TestCase):
+
+    def test_valid_date(self):
+        self.assertEqual(parse_http_timestamp('Sun, 06 Nov 1994 08:49:37 GMT'), 784111777)
+        self.assertEqual(parse_http_date('Sun, 06 Nov 1994 08:49:37 GMT'), datetime.datetime(1994, 11, 6, 8, 49, 37))
+
+    def test_unparseable_date(self):
+        self.assertEqual(parse_http_timestamp('garbage'), None)
+        self.assertEqual(parse_http_date('garbage'), None)
+
+    def test_out_of_range_year(self):
+        # These come from the client, so they must not raise an error.
+        self.assertEqual(parse_http_timestamp('Mon, 01 Jan 10000 00:00:00 GMT'), None)
+        self.assertEqual(parse_http_date('Mon, 01 Jan 10000 00:00:00 GMT'), None)
+        self.assertEqual(parse_http_timestamp('Mon, 01 Jan 99999999999999999999 00:00:00 GMT'), None)
+        self.assertEqual(parse_http_date('Mon, 01 Jan 99999999999999999999 00:00:00 GMT'), None)
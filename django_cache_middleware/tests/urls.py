@@ -1,8 +1,11 @@
 from django.conf.urls.defaults import *
 
-urlpatterns = patterns(
-    'django_cache_middleware.tests.views',
-    (r'^test_authentication_status/', 'test_authentication_status'),
-    (r'^test_cache_page/', 'test_cache_page'),
-    (r'^test_undecorated/', 'test_undecorated'),
-)
+from django_cache_middleware.tests import views
+
+urlpatterns = [
+    url(r'^test_authentication_status/', views.test_authentication_status),
+    url(r'^test_cache_page/', views.test_cache_page),
+    url(r'^test_context_processors/', views.test_context_processors),
+    url(r'^test_logout/', views.test_logout),
+    url(r'^test_undecorated/', views.test_undecorated),
+]
@@ -1,3 +1,4 @@
+from django.contrib.auth import logout
 from django.http import HttpResponse
 from django.template import RequestContext
 from django.views.decorators.cache import cache_page
@@ -10,13 +11,23 @@ def test_authentication_status(request):
     return HttpResponse('test_authentication_status: %s' % request.user)
 
 
+def test_context_processors(request):
+    # Ensure that the context processors aren't accessing the session.
+    RequestContext(request)
+    return HttpResponse('test_context_processors')
+
+
 @cache_page(60*60*24*60)
 def test_cache_page(request):
     # Cached for 60 days.
     return HttpResponse('test_cache_page')
 
 
+@vary_on_authentication_status
+def test_logout(request):
+    logout(request)
+    return HttpResponse('test_logout')
+
+
 def test_undecorated(request):
-    # Ensure that the context processors aren't accessing the session.
-    RequestContext(request)
     return HttpResponse('test_undecorated')